@@ -0,0 +1,389 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+
+import anyio.to_thread
+from fastapi import HTTPException, Request
+from resultados import armazem, identificar_arquivo, resultado_admitido
+from utils import obter_logger_e_configuracao
+
+logger = obter_logger_e_configuracao()
+
+# Expressão para localizar o total de páginas declarado na árvore de páginas do PDF
+REGEX_CONTAGEM_PAGINAS = re.compile(
+    rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b"
+)
+
+# Tamanho médio (em bytes) de uma página, usado quando a contagem não está legível
+BYTES_POR_PAGINA_ESTIMADO = 100 * 1024
+
+# Quantidade de bytes lidos do início e do fim do PDF para localizar a árvore de páginas
+BYTES_LEITURA_CABECALHO = 64 * 1024
+
+# Threads reservados no threadpool, além dos limites das classes, para as dependências
+# síncronas (ex.: verificação do token) e rotas sem controle de admissão
+THREADS_RESERVA = 8
+
+
+def _inteiro_env(nome: str, padrao: int) -> int:
+    """
+    Lê uma variável de ambiente inteira, retornando o valor padrão quando ausente.
+    """
+    valor = os.getenv(nome)
+    if valor is None or valor == "":
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"{nome} deve ser um número inteiro no arquivo .env")
+
+
+def estimar_paginas_pdf(caminho_pdf: str) -> int:
+    """
+    Estima a quantidade de páginas de um PDF sem processar o documento.
+
+    Lê apenas o início e o fim do arquivo, onde costumam ficar o catálogo e a árvore de
+    páginas (inclusive em atualizações incrementais), e procura o campo /Count. Quando o
+    campo não está nesses trechos ou está em um object stream comprimido, usa o tamanho
+    do arquivo como estimativa.
+
+    Args:
+        caminho_pdf (str): O caminho para o arquivo PDF.
+    Returns:
+        int: A quantidade estimada de páginas (no mínimo 1).
+    """
+    # Caminhos inválidos são recusados pela própria rota; aqui só não devem ser lidos
+    if not caminho_pdf.lower().endswith(".pdf") or not os.path.isfile(caminho_pdf):
+        return 1
+
+    try:
+        with open(caminho_pdf, "rb") as file:
+            tamanho = os.fstat(file.fileno()).st_size
+            trechos = [file.read(BYTES_LEITURA_CABECALHO)]
+            if tamanho > BYTES_LEITURA_CABECALHO:
+                file.seek(
+                    max(tamanho - BYTES_LEITURA_CABECALHO, BYTES_LEITURA_CABECALHO)
+                )
+                trechos.append(file.read(BYTES_LEITURA_CABECALHO))
+    except OSError:
+        return 1
+
+    contagens = [
+        int(grupo)
+        for trecho in trechos
+        for encontrado in REGEX_CONTAGEM_PAGINAS.finditer(trecho)
+        for grupo in encontrado.groups()
+        if grupo
+    ]
+    if contagens:
+        # O nó raiz da árvore de páginas contém o total do documento
+        return max(max(contagens), 1)
+
+    return max(math.ceil(tamanho / BYTES_POR_PAGINA_ESTIMADO), 1)
+
+
+class ClasseRota:
+    """
+    Controla a concorrência de um grupo de rotas com custo semelhante.
+
+    Cada requisição ocupa um peso (custo estimado) da capacidade da classe e um dos
+    threads reservados para ela no threadpool das rotas síncronas. Quando não há
+    capacidade ou thread livre, a requisição aguarda em uma fila limitada, em ordem de
+    chegada, até o tempo máximo de espera. Fila cheia ou espera esgotada resultam em HTTP 503.
+
+    Atributos:
+        nome (str): Nome da classe de rota.
+        capacidade (int): Soma máxima dos pesos em execução simultânea.
+        max_requisicoes (int): Quantidade máxima de requisições em execução simultânea.
+        fila_maxima (int): Quantidade máxima de requisições aguardando.
+        espera_maxima (float): Tempo máximo de espera na fila, em segundos.
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        capacidade: int,
+        max_requisicoes: int,
+        fila_maxima: int,
+        espera_maxima: float,
+    ):
+        self.nome = nome
+        self.capacidade = max(capacidade, 1)
+        self.max_requisicoes = max(max_requisicoes, 1)
+        self.fila_maxima = max(fila_maxima, 0)
+        self.espera_maxima = espera_maxima
+        self.em_uso = 0
+        self.ativas = 0
+        self.fila = deque()
+        self.tempo_medio = 1.0  # média móvel do tempo de execução por unidade de peso
+
+    def _retry_after(self) -> int:
+        """
+        Estima, em segundos, quando vale a pena o cliente tentar novamente.
+        """
+        pendente = self.em_uso + sum(peso for peso, _ in self.fila)
+        return max(math.ceil(self.tempo_medio * pendente / self.capacidade), 1)
+
+    def _cabe(self, peso: int) -> bool:
+        return (
+            self.ativas < self.max_requisicoes and self.em_uso + peso <= self.capacidade
+        )
+
+    def _ocupar(self, peso: int):
+        self.em_uso += peso
+        self.ativas += 1
+
+    def _rejeitar(self, motivo: str):
+        logger.warning(f"Admissão recusada na classe '{self.nome}': {motivo}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Erro: Servidor sobrecarregado ({motivo}). Tente novamente mais tarde.",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    def _liberar_fila(self):
+        # Libera, em ordem de chegada, as requisições que cabem na capacidade livre
+        while self.fila:
+            peso, futuro = self.fila[0]
+            if futuro.done():
+                self.fila.popleft()
+                continue
+            if not self._cabe(peso):
+                break
+            self.fila.popleft()
+            self._ocupar(peso)
+            futuro.set_result(None)
+
+    async def adquirir(self, peso: int):
+        """
+        Reserva o peso informado na capacidade da classe, aguardando na fila se necessário.
+
+        Raises:
+            HTTPException: HTTP 503 com Retry-After se a fila estiver cheia ou a espera esgotar.
+        """
+        if not self.fila and self._cabe(peso):
+            self._ocupar(peso)
+            return
+
+        if len(self.fila) >= self.fila_maxima:
+            self._rejeitar("fila de espera cheia")
+
+        futuro = asyncio.get_running_loop().create_future()
+        item = (peso, futuro)
+        self.fila.append(item)
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), timeout=self.espera_maxima)
+        except asyncio.TimeoutError:
+            if futuro.done():
+                # A vaga foi concedida no limite do tempo de espera
+                return
+            futuro.cancel()
+            self.fila.remove(item)
+            self._liberar_fila()
+            self._rejeitar("tempo de espera esgotado")
+        except asyncio.CancelledError:
+            # Cliente desconectou enquanto aguardava
+            if futuro.done() and not futuro.cancelled():
+                self.liberar(peso, None)
+            else:
+                futuro.cancel()
+                if item in self.fila:
+                    self.fila.remove(item)
+            raise
+
+    def liberar(self, peso: int, duracao: float | None):
+        """
+        Devolve o peso à capacidade da classe e atualiza o tempo médio de execução.
+        """
+        self.em_uso -= peso
+        self.ativas -= 1
+        if duracao is not None:
+            self.tempo_medio = 0.8 * self.tempo_medio + 0.2 * (duracao / peso)
+        self._liberar_fila()
+
+    def status(self) -> dict:
+        return {
+            "capacidade": self.capacidade,
+            "em_uso": self.em_uso,
+            "max_requisicoes": self.max_requisicoes,
+            "ativas": self.ativas,
+            "aguardando": len(self.fila),
+        }
+
+
+class CotaToken:
+    """
+    Limita o custo simultâneo em execução por token de API (header 'x-api-token') em
+    uma classe de rota.
+
+    Cada classe tem a sua cota, menor que a capacidade da classe, de modo que um único
+    token não ocupa a classe inteira. A cota só é contada para requisições já admitidas,
+    então filas de OCR ou LLM não afetam a classificação.
+
+    Atributos:
+        limite (int): Soma máxima dos pesos em execução para um mesmo token.
+    """
+
+    def __init__(self, limite: int):
+        self.limite = max(limite, 1)
+        self.em_uso = {}
+
+    def reservar(self, token: int | str, peso: int) -> int:
+        """
+        Reserva o peso para o token informado.
+
+        Returns:
+            int: O peso reservado (limitado à própria cota, para que um único PDF grande
+                não seja sempre recusado).
+        Raises:
+            HTTPException: HTTP 429 com Retry-After se a cota do token for excedida.
+        """
+        peso = min(peso, self.limite)
+        atual = self.em_uso.get(token, 0)
+        if atual + peso > self.limite:
+            logger.warning("Admissão recusada: cota do token excedida.")
+            raise HTTPException(
+                status_code=429,
+                detail="Erro: Cota de requisições simultâneas do token excedida. Tente novamente mais tarde.",
+                headers={"Retry-After": "1"},
+            )
+        self.em_uso[token] = atual + peso
+        return peso
+
+    def liberar(self, token: int | str, peso: int):
+        restante = self.em_uso.get(token, 0) - peso
+        if restante > 0:
+            self.em_uso[token] = restante
+        else:
+            self.em_uso.pop(token, None)
+
+
+ESPERA_MAXIMA = _inteiro_env("ADMISSAO_ESPERA_MAXIMA", 10)
+
+# Classes de rota: o OCR e as LLMs são pesados; a classificação precisa de baixa latência
+CLASSES_ROTA = {
+    "ocr": ClasseRota(
+        "ocr",
+        capacidade=_inteiro_env("ADMISSAO_OCR_CAPACIDADE", 20),
+        max_requisicoes=_inteiro_env("ADMISSAO_OCR_REQUISICOES", 4),
+        fila_maxima=_inteiro_env("ADMISSAO_OCR_FILA", 8),
+        espera_maxima=ESPERA_MAXIMA,
+    ),
+    "llm": ClasseRota(
+        "llm",
+        capacidade=_inteiro_env("ADMISSAO_LLM_CAPACIDADE", 100),
+        max_requisicoes=_inteiro_env("ADMISSAO_LLM_REQUISICOES", 12),
+        fila_maxima=_inteiro_env("ADMISSAO_LLM_FILA", 16),
+        espera_maxima=ESPERA_MAXIMA,
+    ),
+    "extracao": ClasseRota(
+        "extracao",
+        capacidade=_inteiro_env("ADMISSAO_EXTRACAO_CAPACIDADE", 200),
+        max_requisicoes=_inteiro_env("ADMISSAO_EXTRACAO_REQUISICOES", 12),
+        fila_maxima=_inteiro_env("ADMISSAO_EXTRACAO_FILA", 32),
+        espera_maxima=ESPERA_MAXIMA,
+    ),
+    "classificacao": ClasseRota(
+        "classificacao",
+        capacidade=_inteiro_env("ADMISSAO_CLASSIFICACAO_CAPACIDADE", 16),
+        max_requisicoes=_inteiro_env("ADMISSAO_CLASSIFICACAO_REQUISICOES", 8),
+        fila_maxima=_inteiro_env("ADMISSAO_CLASSIFICACAO_FILA", 64),
+        espera_maxima=ESPERA_MAXIMA,
+    ),
+}
+
+# Cota por token em cada classe; deve ficar abaixo da capacidade da classe
+COTAS_TOKEN = {
+    "ocr": CotaToken(_inteiro_env("ADMISSAO_OCR_COTA_TOKEN", 10)),
+    "llm": CotaToken(_inteiro_env("ADMISSAO_LLM_COTA_TOKEN", 50)),
+    "extracao": CotaToken(_inteiro_env("ADMISSAO_EXTRACAO_COTA_TOKEN", 100)),
+    "classificacao": CotaToken(_inteiro_env("ADMISSAO_CLASSIFICACAO_COTA_TOKEN", 12)),
+}
+
+
+def ajustar_threadpool():
+    """
+    Garante que o threadpool das rotas síncronas comporta a soma dos limites de
+    requisições das classes, com folga para as demais rotas e dependências.
+
+    Assim, mesmo com as classes pesadas no limite, a classificação sempre encontra
+    threads livres. Deve ser chamada dentro do event loop (ex.: no lifespan da aplicação).
+    """
+    limitador = anyio.to_thread.current_default_thread_limiter()
+    necessario = (
+        sum(classe.max_requisicoes for classe in CLASSES_ROTA.values())
+        + THREADS_RESERVA
+    )
+    if limitador.total_tokens < necessario:
+        limitador.total_tokens = necessario
+    logger.info(f"Threadpool das rotas síncronas: {limitador.total_tokens} threads.")
+
+
+def controle_admissao(
+    nome_classe: str, ponderar_por_paginas: bool = False, tarefa: str | None = None
+):
+    """
+    Cria a dependência de admissão para as rotas de uma classe.
+
+    Args:
+        nome_classe (str): Nome da classe de rota em CLASSES_ROTA.
+        ponderar_por_paginas (bool): Se True, o peso da requisição é a quantidade de
+            páginas do PDF informado em 'caminho_pdf'; caso contrário, o peso é 1.
+        tarefa (str | None): Tarefa cujo resultado a rota retorna (ver resultados.py).
+            Se o índice do armazém já tiver o resultado do PDF (consultado pelos
+            metadados do arquivo, sem lê-lo), a requisição é atendida com esse resultado
+            sem passar pela fila da classe.
+    Returns:
+        Callable: Dependência do FastAPI que reserva e libera a capacidade da rota.
+    """
+    classe = CLASSES_ROTA[nome_classe]
+    cota = COTAS_TOKEN[nome_classe]
+
+    async def verificar_admissao(request: Request):
+        peso = 1
+        caminho_pdf = request.query_params.get("caminho_pdf")
+
+        if tarefa and caminho_pdf:
+            identificacao = await asyncio.to_thread(identificar_arquivo, caminho_pdf)
+            if identificacao is not None:
+                resultado = await asyncio.to_thread(
+                    armazem.obter_por_arquivo, tarefa, identificacao
+                )
+                if resultado is not None:
+                    # Resultado pré-calculado: a rota o retorna sem ocupar a classe. Como o
+                    # valor já foi lido, um descarte posterior não leva a um cálculo sem admissão
+                    resultado_admitido.set((tarefa, identificacao[0], resultado))
+                    yield
+                    return
+
+        if ponderar_por_paginas and caminho_pdf:
+            # Leitura feita fora do threadpool das rotas síncronas, que pode estar saturado
+            peso = await asyncio.to_thread(estimar_paginas_pdf, caminho_pdf)
+        # Um único PDF muito grande ocupa a classe inteira, mas não fica bloqueado para sempre
+        peso = min(peso, classe.capacidade)
+
+        # Normaliza o token como a verificação em utils.py ('01' e '1' são o mesmo token)
+        token = request.headers.get("x-api-token", "")
+        try:
+            token = int(token)
+        except ValueError:
+            pass
+
+        await classe.adquirir(peso)
+        try:
+            peso_cota = cota.reservar(token, peso)
+        except BaseException:
+            classe.liberar(peso, None)
+            raise
+
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            classe.liberar(peso, time.monotonic() - inicio)
+            cota.liberar(token, peso_cota)
+
+    return verificar_admissao
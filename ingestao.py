@@ -0,0 +1,354 @@
+import os
+import queue
+import threading
+import time
+
+from admissao import CLASSES_ROTA
+from resultados import armazem, chave_arquivo, identificar_arquivo
+from routers.conversoes import (
+    convert_pdf_text_pdf2image,
+    convert_pdf_text_pdfplumber,
+    convert_pdf_txt_pypdf2,
+)
+from routers.llm import resumir_pdf_groq, resumir_pdf_openai
+from utils import obter_logger_e_configuracao
+
+try:
+    import watchfiles
+except ImportError:  # sem watchfiles, os diretórios são varridos periodicamente
+    watchfiles = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem eleição entre workers
+    fcntl = None
+
+logger = obter_logger_e_configuracao()
+
+# Tarefas que podem ser antecipadas; a chave do resultado vem do atributo 'tarefa' de cada
+# função (para os resumos, inclui o modelo e o prompt)
+TAREFAS_DISPONIVEIS = {
+    "pypdf2": convert_pdf_txt_pypdf2,
+    "pdfplumber": convert_pdf_text_pdfplumber,
+    "ocr": convert_pdf_text_pdf2image,
+    "resumo_groq": resumir_pdf_groq,
+    "resumo_openai": resumir_pdf_openai,
+}
+
+# Tempo sem alterações para considerar que o arquivo terminou de ser copiado
+SEGUNDOS_ESTABILIDADE = 2.0
+
+
+class DaemonIngestao:
+    """
+    Observa diretórios e processa antecipadamente os PDFs novos ou alterados.
+
+    Um thread observa os diretórios (inotify via watchfiles ou varredura periódica) e
+    enfileira os PDFs; outro thread, em baixa prioridade, executa as tarefas configuradas
+    e deixa os resultados no armazém, de onde as rotas passam a respondê-los de imediato.
+
+    Atributos:
+        diretorios (list[str]): Diretórios observados (incluindo subdiretórios).
+        tarefas (list[str]): Nomes das tarefas executadas em cada PDF.
+        intervalo_varredura (float): Intervalo, em segundos, da varredura periódica.
+        usar_polling (bool): Se True, usa a varredura mesmo com o watchfiles instalado.
+    """
+
+    def __init__(
+        self,
+        diretorios: list[str],
+        tarefas: list[str],
+        intervalo_varredura: float = 5.0,
+        usar_polling: bool = False,
+    ):
+        for tarefa in tarefas:
+            if tarefa not in TAREFAS_DISPONIVEIS:
+                raise ValueError(f"Tarefa de ingestão desconhecida: '{tarefa}'")
+        for diretorio in diretorios:
+            if not os.path.isdir(diretorio):
+                raise ValueError(f"Diretório de ingestão não encontrado: '{diretorio}'")
+
+        self.diretorios = diretorios
+        self.tarefas = tarefas
+        self.intervalo_varredura = intervalo_varredura
+        self.usar_polling = usar_polling or watchfiles is None
+
+        self.fila = queue.Queue()
+        self.pendentes = set()
+        self.versoes = {}  # última versão (mtime_ns, tamanho) enfileirada de cada PDF
+        self.arquivo_atual = None
+        self.processados = 0
+        self.tarefas_concluidas = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._threads = []
+
+    def iniciar(self):
+        """
+        Inicia os threads de observação e processamento. Os PDFs já existentes são
+        listados pelo próprio observador, sem atrasar a inicialização do servidor.
+        """
+        self._threads = [
+            threading.Thread(
+                target=self._observar, name="ingestao-observador", daemon=True
+            ),
+            threading.Thread(
+                target=self._processar, name="ingestao-processador", daemon=True
+            ),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        modo = "varredura periódica" if self.usar_polling else "inotify"
+        logger.info(f"Ingestão iniciada ({modo}) em: {', '.join(self.diretorios)}")
+
+    def parar(self):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        logger.info("Ingestão finalizada.")
+
+    def _listar_pdfs(self) -> list[str]:
+        caminhos = []
+        for diretorio in self.diretorios:
+            for raiz, _, arquivos in os.walk(diretorio):
+                for arquivo in arquivos:
+                    if arquivo.lower().endswith(".pdf"):
+                        caminhos.append(os.path.join(raiz, arquivo))
+        return caminhos
+
+    def _enfileirar(self, caminho_pdf: str):
+        # Enfileira apenas versões ainda não vistas, evitando repetições da listagem
+        # inicial, da varredura e de eventos sucessivos do inotify para o mesmo arquivo
+        try:
+            info = os.stat(caminho_pdf)
+        except OSError:
+            return
+        versao = (info.st_mtime_ns, info.st_size)
+
+        with self._trava:
+            if caminho_pdf in self.pendentes or self.versoes.get(caminho_pdf) == versao:
+                return
+            self.versoes[caminho_pdf] = versao
+            self.pendentes.add(caminho_pdf)
+        self.fila.put(caminho_pdf)
+
+    def _observar(self):
+        try:
+            for caminho in self._listar_pdfs():
+                self._enfileirar(caminho)
+        except Exception as e:
+            logger.error(
+                f"Erro na listagem inicial dos diretórios de ingestão: {str(e)}"
+            )
+
+        if not self.usar_polling:
+            try:
+                for alteracoes in watchfiles.watch(
+                    *self.diretorios, stop_event=self._parar, yield_on_timeout=True
+                ):
+                    for tipo, caminho in alteracoes:
+                        if (
+                            tipo != watchfiles.Change.deleted
+                            and caminho.lower().endswith(".pdf")
+                        ):
+                            self._enfileirar(caminho)
+                return
+            except Exception as e:
+                logger.error(
+                    f"Erro ao observar diretórios via inotify, usando varredura periódica: {str(e)}"
+                )
+                self.usar_polling = True
+
+        try:
+            self._observar_varredura()
+        except Exception as e:
+            logger.error(f"Erro na varredura dos diretórios de ingestão: {str(e)}")
+
+    def _observar_varredura(self):
+        while not self._parar.wait(self.intervalo_varredura):
+            for caminho in self._listar_pdfs():
+                self._enfileirar(caminho)
+
+    def _reduzir_prioridade(self):
+        # No Linux a prioridade vale por thread, sem afetar as requisições da API
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+    def _aguardar_ociosidade(self):
+        # Não compete com requisições que estão aguardando na fila de admissão
+        while not self._parar.is_set() and any(
+            classe.fila for classe in CLASSES_ROTA.values()
+        ):
+            self._parar.wait(1)
+
+    def _aguardar_estabilidade(self, caminho_pdf: str) -> bool:
+        while not self._parar.is_set():
+            try:
+                modificado = os.stat(caminho_pdf).st_mtime
+            except OSError:
+                return False
+            restante = SEGUNDOS_ESTABILIDADE - (time.time() - modificado)
+            if restante <= 0:
+                return True
+            self._parar.wait(restante)
+        return False
+
+    def _processar(self):
+        self._reduzir_prioridade()
+        while not self._parar.is_set():
+            try:
+                caminho_pdf = self.fila.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with self._trava:
+                self.pendentes.discard(caminho_pdf)
+                self.arquivo_atual = caminho_pdf
+
+            if self._aguardar_estabilidade(caminho_pdf):
+                self._executar_tarefas(caminho_pdf)
+
+            with self._trava:
+                self.arquivo_atual = None
+
+    def _executar_tarefas(self, caminho_pdf: str):
+        houve_falha = False
+        executadas = 0
+        for tarefa in self.tarefas:
+            self._aguardar_ociosidade()
+            if self._parar.is_set():
+                return
+
+            funcao = TAREFAS_DISPONIVEIS[tarefa]
+            chave = chave_arquivo(funcao.tarefa, caminho_pdf)
+            if chave is None:
+                continue
+            if armazem.contem(chave):
+                # Ex.: PDF idêntico em outro caminho; indexa para que as rotas o encontrem
+                identificacao = identificar_arquivo(caminho_pdf)
+                if identificacao is not None:
+                    armazem.indexar(funcao.tarefa, identificacao, chave)
+                continue
+
+            try:
+                funcao(caminho_pdf)
+                executadas += 1
+                with self._trava:
+                    self.tarefas_concluidas += 1
+            except Exception as e:
+                houve_falha = True
+                logger.error(
+                    f"Erro na ingestão de '{caminho_pdf}' ({tarefa}): {str(e)}"
+                )
+
+        # PDFs cujas tarefas já estavam todas armazenadas não contam como processados
+        with self._trava:
+            if houve_falha:
+                self.falhas += 1
+            elif executadas:
+                self.processados += 1
+
+    def status(self) -> dict:
+        with self._trava:
+            threads = {thread.name: thread.is_alive() for thread in self._threads}
+            return {
+                "ativo": bool(threads) and all(threads.values()),
+                "threads": threads,
+                "modo": "polling" if self.usar_polling else "inotify",
+                "diretorios": self.diretorios,
+                "tarefas": self.tarefas,
+                "descobertos": len(self.versoes),
+                "processados": self.processados,
+                "falhas": self.falhas,
+                "tarefas_concluidas": self.tarefas_concluidas,
+                "backlog": self.fila.qsize() + (1 if self.arquivo_atual else 0),
+                "arquivo_atual": self.arquivo_atual,
+            }
+
+
+daemon_ingestao = None
+arquivo_eleicao = None
+
+
+def eleger_worker_ingestao() -> bool:
+    """
+    Garante que, com vários workers, apenas um deles execute o daemon de ingestão.
+
+    O worker eleito mantém uma trava exclusiva sobre um arquivo ao lado do armazém de
+    resultados; como o armazém é compartilhado, os demais workers usam os resultados dele.
+
+    Returns:
+        bool: True se este worker foi eleito.
+    """
+    global arquivo_eleicao
+
+    if fcntl is None:
+        return True
+
+    try:
+        arquivo = open(f"{armazem.caminho}.ingestao.lock", "w")
+    except OSError as e:
+        # Sem o arquivo de eleição o armazém também está inacessível; a ingestão não teria efeito
+        logger.error(f"Erro ao criar o arquivo de eleição da ingestão: {str(e)}")
+        return False
+
+    try:
+        fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        arquivo.close()
+        return False
+
+    arquivo_eleicao = arquivo
+    return True
+
+
+def iniciar_ingestao() -> DaemonIngestao | None:
+    """
+    Inicia o daemon de ingestão se INGESTAO_DIRETORIOS estiver definido no .env.
+
+    Returns:
+        DaemonIngestao | None: O daemon iniciado, ou None se a ingestão estiver desativada.
+    """
+    global daemon_ingestao
+
+    diretorios = [
+        d.strip() for d in os.getenv("INGESTAO_DIRETORIOS", "").split(",") if d.strip()
+    ]
+    if not diretorios:
+        return None
+
+    if not eleger_worker_ingestao():
+        logger.info("Ingestão já está em execução em outro worker.")
+        return None
+
+    tarefas = [
+        t.strip()
+        for t in os.getenv(
+            "INGESTAO_TAREFAS", "pypdf2,resumo_groq,resumo_openai"
+        ).split(",")
+        if t.strip()
+    ]
+    daemon_ingestao = DaemonIngestao(
+        diretorios,
+        tarefas,
+        intervalo_varredura=float(os.getenv("INGESTAO_INTERVALO", "5")),
+        usar_polling=os.getenv("INGESTAO_POLLING", "").lower() in ("1", "true", "sim"),
+    )
+    daemon_ingestao.iniciar()
+    return daemon_ingestao
+
+
+def parar_ingestao():
+    global daemon_ingestao, arquivo_eleicao
+
+    if daemon_ingestao is not None:
+        daemon_ingestao.parar()
+        daemon_ingestao = None
+
+    if arquivo_eleicao is not None:
+        arquivo_eleicao.close()
+        arquivo_eleicao = None
@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
-from routers import conversoes, llm
+from admissao import ajustar_threadpool
+from ingestao import iniciar_ingestao, parar_ingestao
+from routers import conversoes, ingestao, llm
 from utils import commom_verificacao_api_token
 
 description = """
@@ -7,10 +10,24 @@ description = """
     Desenvolvido por Guilherme Lemes, Raphael Rodrigues e Thiago Santos, 
     não obstante o código estar concentrado em uma única conta no github."""
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ajusta o threadpool ao controle de admissão, inicia o daemon de ingestão antecipada
+    (se configurado) e o finaliza no desligamento.
+    """
+    ajustar_threadpool()
+    iniciar_ingestao()
+    yield
+    parar_ingestao()
+
+
 app = FastAPI(
     title="API - Projeto Final",
     description=description,
     version="0.1",
+    lifespan=lifespan,
     terms_of_service="http://example.com/terms/",
     contact={
         "name": "Raphael Rodrigues",
@@ -24,3 +41,4 @@ app = FastAPI(
 
 app.include_router(conversoes.router)
 app.include_router(llm.router)
+app.include_router(ingestao.router)
@@ -23,8 +23,10 @@ class NomeGrupo(str, Enum):
     Atributos:
         operacoes (str): Retorna o nome do grupo de operações matemáticas simples.
         teste (str): Retorna o nome do grupo de teste.
+        ingestao (str): Retorna o nome do grupo de ingestão antecipada de PDFs.
     """
 
     conversao = "Conversão de arquivos PDF para TXT"
     llm = "Manipulação de PDFs com LLM"
     classificacao = "Modelos de classificação"
+    ingestao = "Ingestão antecipada de PDFs"
@@ -0,0 +1,476 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+
+from utils import obter_logger_e_configuracao
+
+logger = obter_logger_e_configuracao()
+
+# Intervalo entre consultas enquanto outro worker calcula o mesmo resultado
+SEGUNDOS_ESPERA_TRAVA = 0.2
+
+# Intervalo mínimo entre atualizações da data de acesso de um mesmo resultado
+SEGUNDOS_ATUALIZACAO_ACESSO = 60
+
+# Resultado já lido pelo controle de admissão para a requisição atual, no formato
+# (tarefa, caminho real, valor); a rota o retorna sem consultar o armazém de novo
+resultado_admitido = ContextVar("resultado_admitido", default=None)
+
+
+def processo_ativo(pid: int) -> bool:
+    """
+    Verifica se o processo (worker) com o pid informado ainda está em execução.
+    """
+    if os.name == "nt":
+        # No Windows, os.kill finaliza o processo; a trava expira por tempo
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ArmazemResultados:
+    """
+    Armazena os resultados já calculados de extrações e LLMs em um arquivo SQLite
+    compartilhado por todos os workers (uvicorn/gunicorn) da máquina.
+
+    O banco usa o modo WAL, de modo que leituras não bloqueiam a gravação de outro
+    worker. Cada resultado é publicado em uma única transação, e os resultados acessados
+    há mais tempo são descartados quando o tamanho total ultrapassa o limite. Uma trava
+    por chave garante que apenas um worker calcula um mesmo resultado por vez. Um índice
+    por (tarefa, caminho, data de modificação, tamanho) permite localizar o resultado de
+    um arquivo sem ler o seu conteúdo.
+
+    Falhas do SQLite (banco bloqueado, diretório somente leitura etc.) são registradas
+    no log e nunca impedem a resposta: o resultado é calculado e retornado sem cache.
+
+    Atributos:
+        caminho (str): Caminho do arquivo SQLite.
+        max_bytes (int): Tamanho máximo, em bytes, dos resultados armazenados.
+        segundos_trava (int): Validade da trava de cálculo, caso o worker seja finalizado.
+        segundos_espera (int): Tempo máximo aguardando o cálculo de outro worker.
+    """
+
+    def __init__(
+        self, caminho: str, max_bytes: int, segundos_trava: int, segundos_espera: int
+    ):
+        self.caminho = caminho
+        self.max_bytes = max(max_bytes, 1)
+        self.segundos_trava = segundos_trava
+        self.segundos_espera = segundos_espera
+        self.acertos = 0
+        self.faltas = 0
+        self._local = threading.local()
+
+    def _conexao(self) -> sqlite3.Connection:
+        # Conexões não podem ser compartilhadas entre threads nem herdadas em um fork
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None and self._local.pid == os.getpid():
+            return conexao
+
+        conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+        try:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, "
+                "tamanho INTEGER NOT NULL, acessado_em REAL NOT NULL)"
+            )
+            conexao.execute(
+                "CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (acessado_em)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS arquivos ("
+                "tarefa TEXT NOT NULL, caminho TEXT NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "tamanho INTEGER NOT NULL, chave TEXT NOT NULL, PRIMARY KEY (tarefa, caminho))"
+            )
+            conexao.execute(
+                "CREATE INDEX IF NOT EXISTS idx_arquivos_chave ON arquivos (chave)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS travas ("
+                "chave TEXT PRIMARY KEY, pid INTEGER NOT NULL, expira_em REAL NOT NULL)"
+            )
+        except sqlite3.Error:
+            conexao.close()
+            raise
+        self._local.conexao = conexao
+        self._local.pid = os.getpid()
+        return conexao
+
+    def _ler(self, chave: str):
+        try:
+            linha = (
+                self._conexao()
+                .execute(
+                    "SELECT valor, acessado_em FROM resultados WHERE chave = ?",
+                    (chave,),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler o armazém de resultados: {str(e)}")
+            return None
+        if linha is None:
+            return None
+
+        valor, acessado_em = linha
+        agora = time.time()
+        if agora - acessado_em > SEGUNDOS_ATUALIZACAO_ACESSO:
+            # Atualização apenas para o descarte por acesso; a falha não invalida a leitura
+            try:
+                self._conexao().execute(
+                    "UPDATE resultados SET acessado_em = ? WHERE chave = ?",
+                    (agora, chave),
+                )
+            except sqlite3.Error as e:
+                logger.warning(
+                    f"Erro ao atualizar acesso no armazém de resultados: {str(e)}"
+                )
+        return json.loads(valor)
+
+    def obter(self, chave: str):
+        resultado = self._ler(chave)
+        if resultado is None:
+            self.faltas += 1
+        else:
+            self.acertos += 1
+        return resultado
+
+    def contem(self, chave: str) -> bool:
+        try:
+            linha = (
+                self._conexao()
+                .execute("SELECT 1 FROM resultados WHERE chave = ?", (chave,))
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler o armazém de resultados: {str(e)}")
+            return False
+        return linha is not None
+
+    def gravar(self, chave: str, valor):
+        """
+        Publica o resultado e descarta os resultados menos acessados se o limite for excedido.
+
+        Em caso de falha do SQLite, o erro é registrado e o resultado apenas não é armazenado.
+        """
+        conteudo = json.dumps(valor, ensure_ascii=False)
+        tamanho = len(conteudo.encode("utf-8"))
+
+        try:
+            conexao = self._conexao()
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                conexao.execute(
+                    "INSERT OR REPLACE INTO resultados (chave, valor, tamanho, acessado_em) "
+                    "VALUES (?, ?, ?, ?)",
+                    (chave, conteudo, tamanho, time.time()),
+                )
+                (total,) = conexao.execute(
+                    "SELECT COALESCE(SUM(tamanho), 0) FROM resultados"
+                ).fetchone()
+                excesso = total - self.max_bytes
+                if excesso > 0:
+                    descartar = []
+                    for chave_antiga, tamanho_antigo in conexao.execute(
+                        "SELECT chave, tamanho FROM resultados WHERE chave != ? ORDER BY acessado_em",
+                        (chave,),
+                    ):
+                        if excesso <= 0:
+                            break
+                        descartar.append((chave_antiga,))
+                        excesso -= tamanho_antigo
+                    conexao.executemany(
+                        "DELETE FROM resultados WHERE chave = ?", descartar
+                    )
+                    conexao.executemany(
+                        "DELETE FROM arquivos WHERE chave = ?", descartar
+                    )
+                conexao.execute("COMMIT")
+            except BaseException:
+                if conexao.in_transaction:
+                    conexao.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao gravar no armazém de resultados: {str(e)}")
+
+    def obter_por_arquivo(self, tarefa: str, identificacao: tuple):
+        """
+        Retorna o resultado da tarefa para o arquivo, consultando apenas o índice de
+        metadados (sem ler o arquivo).
+
+        Args:
+            tarefa (str): Nome da tarefa.
+            identificacao (tuple): Retorno de identificar_arquivo.
+        Returns:
+            O resultado armazenado, ou None se não houver.
+        """
+        try:
+            linha = (
+                self._conexao()
+                .execute(
+                    "SELECT chave FROM arquivos WHERE tarefa = ? AND caminho = ? "
+                    "AND mtime_ns = ? AND tamanho = ?",
+                    (tarefa, *identificacao),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Erro ao ler o armazém de resultados: {str(e)}")
+            return None
+        if linha is None:
+            return None
+        return self.obter(linha[0])
+
+    def indexar(self, tarefa: str, identificacao: tuple, chave: str):
+        """
+        Registra no índice de metadados a chave do resultado da tarefa para o arquivo.
+        """
+        try:
+            conexao = self._conexao()
+            linha = conexao.execute(
+                "SELECT 1 FROM arquivos WHERE tarefa = ? AND caminho = ? "
+                "AND mtime_ns = ? AND tamanho = ? AND chave = ?",
+                (tarefa, *identificacao, chave),
+            ).fetchone()
+            if linha is None:
+                conexao.execute(
+                    "INSERT OR REPLACE INTO arquivos (tarefa, caminho, mtime_ns, tamanho, chave) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (tarefa, *identificacao, chave),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao indexar no armazém de resultados: {str(e)}")
+
+    def _travar(self, chave: str) -> bool:
+        conexao = self._conexao()
+        agora = time.time()
+
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conexao.execute(
+                "SELECT pid, expira_em FROM travas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is not None:
+                pid, expira_em = linha
+                # Trava de um worker finalizado (OOM, timeout do gunicorn) não é liberada por ele
+                if expira_em < agora or not processo_ativo(pid):
+                    logger.warning(f"Liberando trava abandonada pelo processo {pid}.")
+                    conexao.execute("DELETE FROM travas WHERE chave = ?", (chave,))
+            cursor = conexao.execute(
+                "INSERT OR IGNORE INTO travas (chave, pid, expira_em) VALUES (?, ?, ?)",
+                (chave, os.getpid(), agora + self.segundos_trava),
+            )
+            conexao.execute("COMMIT")
+        except BaseException:
+            if conexao.in_transaction:
+                conexao.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _destravar(self, chave: str):
+        try:
+            self._conexao().execute(
+                "DELETE FROM travas WHERE chave = ? AND pid = ?", (chave, os.getpid())
+            )
+        except sqlite3.Error as e:
+            # A trava expira por tempo ou é liberada quando este processo for finalizado
+            logger.error(f"Erro ao liberar trava do armazém de resultados: {str(e)}")
+
+    def calcular(self, chave: str, funcao):
+        """
+        Retorna o resultado armazenado ou o calcula, garantindo um único cálculo por chave.
+
+        Enquanto outro worker (ou thread) calcula a mesma chave, aguarda a publicação do
+        resultado. Se o cálculo falhar, a trava é liberada e o próximo a obtê-la tenta de novo.
+        Se a espera ultrapassar 'segundos_espera', calcula sem a trava.
+
+        Args:
+            chave (str): A chave do resultado.
+            funcao (Callable): Função sem argumentos que calcula o resultado.
+        Returns:
+            O resultado armazenado ou calculado.
+        """
+        resultado = self.obter(chave)
+        if resultado is not None:
+            return resultado
+
+        inicio = time.monotonic()
+        while True:
+            try:
+                travado = self._travar(chave)
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao obter trava do armazém de resultados: {str(e)}")
+                return funcao()
+
+            if travado:
+                try:
+                    # Outro worker pode ter publicado o resultado antes da trava ser obtida
+                    resultado = self._ler(chave)
+                    if resultado is None:
+                        resultado = funcao()
+                        self.gravar(chave, resultado)
+                    return resultado
+                finally:
+                    self._destravar(chave)
+
+            if time.monotonic() - inicio > self.segundos_espera:
+                logger.warning(
+                    f"Tempo de espera pela trava esgotado; calculando '{chave}' sem trava."
+                )
+                resultado = funcao()
+                self.gravar(chave, resultado)
+                return resultado
+
+            time.sleep(SEGUNDOS_ESPERA_TRAVA)
+            resultado = self._ler(chave)
+            if resultado is not None:
+                return resultado
+
+    def status(self) -> dict:
+        try:
+            entradas, total = (
+                self._conexao()
+                .execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados")
+                .fetchone()
+            )
+            erro = None
+        except sqlite3.Error as e:
+            entradas, total, erro = None, None, str(e)
+        return {
+            "arquivo": self.caminho,
+            "erro": erro,
+            "entradas": entradas,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "acertos": self.acertos,  # contadores locais deste worker
+            "faltas": self.faltas,
+        }
+
+
+armazem = ArmazemResultados(
+    os.getenv(
+        "RESULTADOS_ARQUIVO",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.sqlite3"),
+    ),
+    max_bytes=int(os.getenv("RESULTADOS_MAX_BYTES", str(512 * 1024 * 1024))),
+    segundos_trava=int(os.getenv("RESULTADOS_SEGUNDOS_TRAVA", "900")),
+    segundos_espera=int(os.getenv("RESULTADOS_SEGUNDOS_ESPERA", "120")),
+)
+
+
+@lru_cache(maxsize=4096)
+def _hash_arquivo(caminho: str, mtime_ns: int, tamanho: int) -> str:
+    # A data de modificação e o tamanho fazem parte da chave do cache, de modo que o
+    # arquivo só é lido novamente quando for alterado
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as file:
+        for bloco in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def identificar_arquivo(caminho_pdf: str) -> tuple | None:
+    """
+    Identifica a versão atual de um arquivo PDF sem ler o seu conteúdo.
+
+    Args:
+        caminho_pdf (str): O caminho para o arquivo PDF.
+    Returns:
+        tuple | None: (caminho real, data de modificação em ns, tamanho), ou None se o
+            caminho não for um arquivo PDF.
+    """
+    # Caminhos inválidos são recusados pela própria rota, sem que o arquivo seja lido
+    if not caminho_pdf.lower().endswith(".pdf") or not os.path.isfile(caminho_pdf):
+        return None
+
+    try:
+        caminho = os.path.realpath(caminho_pdf)
+        info = os.stat(caminho)
+    except OSError:
+        return None
+    return (caminho, info.st_mtime_ns, info.st_size)
+
+
+def chave_arquivo(tarefa: str, caminho_pdf: str) -> str | None:
+    """
+    Monta a chave de um resultado a partir da tarefa e do conteúdo do arquivo.
+
+    A chave usa o hash do conteúdo, de modo que PDFs idênticos em caminhos diferentes
+    compartilham o resultado e um arquivo alterado nunca reaproveita um resultado antigo.
+
+    Args:
+        tarefa (str): Nome da tarefa (extrator ou resumo).
+        caminho_pdf (str): O caminho para o arquivo PDF.
+    Returns:
+        str | None: A chave do resultado, ou None se o caminho não for um PDF legível.
+    """
+    identificacao = identificar_arquivo(caminho_pdf)
+    if identificacao is None:
+        return None
+
+    try:
+        return f"{tarefa}:{_hash_arquivo(*identificacao)}"
+    except OSError:
+        return None
+
+
+def chave_texto(tarefa: str, *partes: str) -> str:
+    """
+    Monta a chave de um resultado a partir da tarefa e dos textos de entrada (ex.: prompts).
+    """
+    sha = hashlib.sha256()
+    for parte in partes:
+        sha.update(parte.encode("utf-8"))
+        sha.update(b"\0")
+    return f"{tarefa}:{sha.hexdigest()}"
+
+
+def memorizar_por_arquivo(tarefa: str):
+    """
+    Decorador que reaproveita o resultado de uma função que recebe 'caminho_pdf'.
+
+    Resultados só são armazenados quando a função termina sem erro. Se o controle de
+    admissão já leu o resultado desta requisição, ele é retornado diretamente.
+
+    Args:
+        tarefa (str): Nome da tarefa, usado na chave do resultado.
+    """
+
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(caminho_pdf: str, *args, **kwargs):
+            identificacao = identificar_arquivo(caminho_pdf)
+            if identificacao is None:
+                return funcao(caminho_pdf, *args, **kwargs)
+
+            admitido = resultado_admitido.get()
+            if admitido is not None and admitido[:2] == (tarefa, identificacao[0]):
+                return admitido[2]
+
+            chave = chave_arquivo(tarefa, caminho_pdf)
+            if chave is None:
+                return funcao(caminho_pdf, *args, **kwargs)
+
+            resultado = armazem.calcular(
+                chave, lambda: funcao(caminho_pdf, *args, **kwargs)
+            )
+            armazem.indexar(tarefa, identificacao, chave)
+            return resultado
+
+        # Permite que a ingestão consulte a mesma chave usada pela função
+        envolvida.tarefa = tarefa
+        return envolvida
+
+    return decorador
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from admissao import controle_admissao
 from models import NomeGrupo
+from resultados import memorizar_por_arquivo
 from utils import obter_logger_e_configuracao
 import os
 import PyPDF2
@@ -18,7 +20,9 @@ router = APIRouter()
     summary="Converte um PDF para texto - biblioteca PyPDF2",
     description="Extrai o texto de um arquivo PDF usando a biblioteca PyPDF2 do Python.",
     tags=[NomeGrupo.conversao],
+    dependencies=[Depends(controle_admissao("extracao", ponderar_por_paginas=True, tarefa="pypdf2"))],
 )
+@memorizar_por_arquivo("pypdf2")
 def convert_pdf_txt_pypdf2(caminho_pdf: str) -> str:
     """
     Converte um arquivo PDF para texto usando PyPDF2.
@@ -69,12 +73,14 @@ def convert_pdf_txt_pypdf2(caminho_pdf: str) -> str:
     summary="Converte um PDF para texto usando o PDFPlumber",
     description="Extrai o texto de um arquivo PDF usando a biblioteca PDFPlumber do Python.",
     tags=[NomeGrupo.conversao],
+    dependencies=[Depends(controle_admissao("extracao", ponderar_por_paginas=True, tarefa="pdfplumber"))],
 )
 def converter_pdf_pdfplumber(caminho_pdf: str):
     texto_extraido = convert_pdf_text_pdfplumber(caminho_pdf)
     return {"texto": texto_extraido}
 
 
+@memorizar_por_arquivo("pdfplumber")
 def convert_pdf_text_pdfplumber(caminho_pdf: str) -> str:
     """
     Converte um arquivo PDF para texto usando pdfplumber.
@@ -131,12 +137,15 @@ def convert_pdf_text_pdfplumber(caminho_pdf: str) -> str:
     summary="Converte um PDF para texto usando o pymupdf (ou fitz)",
     description="Extrai o texto de um arquivo PDF usando a biblioteca pymupdf (ou fitz) do Python.",
     tags=[NomeGrupo.conversao],
+    # A rota utiliza o extrator do pdfplumber, e portanto o mesmo resultado armazenado
+    dependencies=[Depends(controle_admissao("extracao", ponderar_por_paginas=True, tarefa="pdfplumber"))],
 )
 def converter_pdf_pymupdf(caminho_pdf: str):
     texto_extraido = convert_pdf_text_pdfplumber(caminho_pdf)
     return {"texto": texto_extraido}
 
 
+@memorizar_por_arquivo("fitz")
 def convert_pdf_text_pymupdf(caminho_pdf: str) -> str:
     """
     Converte um arquivo PDF para texto usando pymupdf (ou fitz).
@@ -195,12 +204,14 @@ def convert_pdf_text_pymupdf(caminho_pdf: str) -> str:
     "do diretório poppler baixado na máquina. É necessário também a inclusão dos caminhos do poppler e do Tesseract "
     "nas variáveis de ambiente/sistema.",
     tags=[NomeGrupo.conversao],
+    dependencies=[Depends(controle_admissao("ocr", ponderar_por_paginas=True, tarefa="ocr"))],
 )
 def converter_pdf_pdf2image(caminho_pdf: str):
     texto_extraido = convert_pdf_text_pdf2image(caminho_pdf)
     return {"texto": texto_extraido}
 
 
+@memorizar_por_arquivo("ocr")
 def convert_pdf_text_pdf2image(caminho_pdf: str) -> str:
     """
     Converte um arquivo PDF digitalizado para texto usando pdf2image e OCR (pytesseract).
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from models import NomeGrupo
+from resultados import armazem
+import ingestao
+import os
+
+router = APIRouter()
+
+
+@router.get(
+    "/v1/ingestao/status",
+    summary="Consulta o andamento da ingestão antecipada de PDFs.",
+    description="Retorna o progresso e o backlog do daemon que processa antecipadamente os PDFs dos diretórios "
+    "observados, além das estatísticas do armazém de resultados.",
+    tags=[NomeGrupo.ingestao],
+)
+def status_ingestao():
+    """
+    Retorna as métricas do daemon de ingestão e do armazém de resultados.
+
+    Returns:
+        dict: Um dicionário com o status da ingestão e do armazém.
+    """
+    if ingestao.daemon_ingestao is None:
+        # Com vários workers, o daemon pode estar em execução em outro processo
+        status_daemon = {"ativo": False, "pid": os.getpid()}
+    else:
+        status_daemon = ingestao.daemon_ingestao.status()
+
+    return {"ingestao": status_daemon, "resultados": armazem.status()}
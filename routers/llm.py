@@ -1,5 +1,7 @@
-from fastapi import Query, APIRouter, HTTPException, FastAPI
+from fastapi import Depends, Query, APIRouter, HTTPException, FastAPI
+from admissao import controle_admissao
 from models import ModeloOpenAi, NomeGrupo
+from resultados import armazem, chave_texto, memorizar_por_arquivo
 from routers.conversoes import convert_pdf_txt_pypdf2
 from utils import limpar_json_formatado, obter_logger_e_configuracao
 import os
@@ -10,6 +12,29 @@ logger = obter_logger_e_configuracao()
 
 router = APIRouter()
 
+# Modelos e prompts dos resumos. Ambos fazem parte da tarefa (e da chave dos resultados
+# armazenados), de modo que alterá-los invalida os resumos já calculados.
+MODELO_RESUMO_GROQ = "llama-3.1-8b-instant"
+PROMPT_RESUMO_GROQ = (
+    "A partir do conteúdo txt extraído do PDF, crie um resumo didático. "
+    "O resumo deve ser claro, objetivo e facilitar a compreensão para o usuário final. Coloque quebra de linhas no resumo. "
+    "Não exicitar a palavra resumo no corpo da resposta\n\n"
+    "Texto extraído:\n{texto_pdf}"
+)
+TAREFA_RESUMO_GROQ = chave_texto("resumo_groq", MODELO_RESUMO_GROQ, PROMPT_RESUMO_GROQ)
+
+MODELO_RESUMO_OPENAI = "gpt-4o-mini"  # Modelos da OpenAI: gpt-4o, gpt-4o-turbo, gpt-4o-mini
+INSTRUCAO_RESUMO_OPENAI = "Você é um assistente para resumir longos textos em PDF."
+PROMPT_RESUMO_OPENAI = (
+    "A partir do conteúdo txt extraído do PDF, crie um resumo esquemático e o mais didático possível. Ao final do resumo, "
+    "O resumo deve ser em português, claro, objetivo e facilitar a compreensão para o usuário final. Coloque quebra de linhas no resumo. "
+    "Não explicitar a palavra resumo no corpo da resposta\n\n"
+    "Texto extraído:\n{texto_pdf}"
+)
+TAREFA_RESUMO_OPENAI = chave_texto(
+    "resumo_openai", MODELO_RESUMO_OPENAI, INSTRUCAO_RESUMO_OPENAI, PROMPT_RESUMO_OPENAI
+)
+
 
 # Utilizando a Groq como LLM
 @router.post(
@@ -17,12 +42,14 @@ router = APIRouter()
     summary="Gera um resumo do PDF utilizando Groq como LLM - modelo llama-3.1-8b-instant.",
     description="Extrai o texto do PDF e produz um resumo estruturado em tópicos utilizando a Groq como LLM - modelo llama-3.1-8b-instant.",
     tags=[NomeGrupo.llm],
+    dependencies=[Depends(controle_admissao("llm", ponderar_por_paginas=True, tarefa=TAREFA_RESUMO_GROQ))],
 )
 def resumir_pdf_llm_groq(caminho_pdf: str):
     resultado = resumir_pdf_groq(caminho_pdf)
     return resultado
 
 
+@memorizar_por_arquivo(TAREFA_RESUMO_GROQ)
 def resumir_pdf_groq(caminho_pdf: str) -> dict:
     """
     Converte um PDF para um resumo estruturado utilizando Groq como LLM.
@@ -65,12 +92,7 @@ def resumir_pdf_groq(caminho_pdf: str) -> dict:
         )
 
     # Cria o prompt para a LLM
-    prompt = (
-        "A partir do conteúdo txt extraído do PDF, crie um resumo didático. "
-        "O resumo deve ser claro, objetivo e facilitar a compreensão para o usuário final. Coloque quebra de linhas no resumo. "
-        "Não exicitar a palavra resumo no corpo da resposta\n\n"
-        f"Texto extraído:\n{texto_pdf}"
-    )
+    prompt = PROMPT_RESUMO_GROQ.format(texto_pdf=texto_pdf)
 
     # Obtém a chave da API do Groq
     api_key = os.getenv("GROQ_API_KEY")
@@ -85,7 +107,7 @@ def resumir_pdf_groq(caminho_pdf: str) -> dict:
     try:
         resposta = client.chat.completions.create(
             messages=[{"role": "user", "content": prompt}],
-            model="llama-3.1-8b-instant",
+            model=MODELO_RESUMO_GROQ,
         )
 
         resumo = resposta.choices[0].message.content
@@ -115,6 +137,23 @@ def resumir_pdf_groq(caminho_pdf: str) -> dict:
 
 # Utilizando a OpenAi como LLM
 def acessar_api_openai(content: str, prompt: str, modelo: str) -> str:
+    """
+    Acessa a API da OpenAI, reaproveitando a resposta já armazenada para o mesmo
+    modelo, contexto e prompt (inclusive se calculada por outro worker).
+
+    Args:
+        content (str): Contexto do sistema para a IA.
+        prompt (str): Entrada do usuário.
+        modelo (str): Modelo da OpenAI a ser utilizado.
+
+    Returns:
+        str: A resposta formatada do modelo da OpenAI.
+    """
+    chave = chave_texto("openai", modelo, content, prompt)
+    return armazem.calcular(chave, lambda: consultar_api_openai(content, prompt, modelo))
+
+
+def consultar_api_openai(content: str, prompt: str, modelo: str) -> str:
     """
     Acessa a API da OpenAI para processar uma conversa com base no conteúdo e no prompt.
 
@@ -196,7 +235,9 @@ def acessar_api_openai(content: str, prompt: str, modelo: str) -> str:
     summary="Gera um resumo do PDF utilizando a OpenAI como LLM - modelo gpt-4o-mini.",
     description="Extrai o texto do PDF e produz um resumo estruturado em tópicos utilizando a OpenaAI como LLM - modelo gpt-4o-mini.",
     tags=[NomeGrupo.llm],
+    dependencies=[Depends(controle_admissao("llm", ponderar_por_paginas=True, tarefa=TAREFA_RESUMO_OPENAI))],
 )
+@memorizar_por_arquivo(TAREFA_RESUMO_OPENAI)
 def resumir_pdf_openai(caminho_pdf: str) -> str:
     """
     Converte um PDF para TXT estruturado com tags XML utilizando uma LLM (OPenAI).
@@ -209,15 +250,9 @@ def resumir_pdf_openai(caminho_pdf: str) -> str:
     # Extrai o texto bruto do PDF
     texto_pdf = convert_pdf_txt_pypdf2(caminho_pdf)
 
-    modelo_user = "gpt-4o-mini"  # Modelos da OpenAI: gpt-4o, gpt-4o-turbo, gpt-4o-mini
-    instrucao_user = "Você é um assistente para resumir longos textos em PDF."
-    prompt_user = (
-        "A partir do conteúdo txt extraído do PDF, crie um resumo esquemático e o mais didático possível. Ao final do resumo, "
-        "O resumo deve ser em português, claro, objetivo e facilitar a compreensão para o usuário final. Coloque quebra de linhas no resumo. "
-        "Não explicitar a palavra resumo no corpo da resposta\n\n"
-        f"Texto extraído:\n{texto_pdf}"
-        ""
-    )
+    modelo_user = MODELO_RESUMO_OPENAI
+    instrucao_user = INSTRUCAO_RESUMO_OPENAI
+    prompt_user = PROMPT_RESUMO_OPENAI.format(texto_pdf=texto_pdf)
 
     resultado = acessar_api_openai(
         content=instrucao_user, prompt=prompt_user, modelo=modelo_user
@@ -231,6 +266,7 @@ def resumir_pdf_openai(caminho_pdf: str) -> str:
     summary="Manipula um PDF utilizando a OpenAI como LLM.",
     description="Executa qualquer tarefa de manipulação de PDF, conforme parâmetros informados pelo usuário, utilizando a OpenaAI como LLM.",
     tags=[NomeGrupo.llm],
+    dependencies=[Depends(controle_admissao("llm", ponderar_por_paginas=True))],
 )
 def manipular_pdf_llm_openai(
     # caminho_pdf: str = fr"C:\Users\rapha\Downloads\15_11_25_482_32_Licen_a_para_tratamento_de_doen_a_em_pessoa_da_fam_lia_efetivo.pdf",
@@ -289,6 +325,7 @@ def manipular_pdf_openai(
     summary="Classifica uma denúncia na área de atuação da Promotoria de Justiça usando um LLM.",
     description="Classifica uma denúncia na área de atuação da Promotoria de Justiça de acordo com o caso.",
     tags=[NomeGrupo.classificacao],
+    dependencies=[Depends(controle_admissao("classificacao"))],
 )
 
 def classificar_denuncia(denuncia: str):